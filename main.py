@@ -1,12 +1,14 @@
 import asyncio
-import json
 import logging
 import re
 import os
+import tempfile
 from datetime import datetime, time
-from bs4 import BeautifulSoup
+import orjson
+from selectolax.parser import HTMLParser
 import aiohttp
-from telegram import Update, Bot, ReplyKeyboardMarkup, KeyboardButton
+from telegram import Update, Bot, ReplyKeyboardMarkup, KeyboardButton, InputMediaPhoto
+from telegram.error import RetryAfter
 from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
 from dotenv import load_dotenv
 
@@ -21,6 +23,8 @@ BASE_URL = "https://dns-shop.by"
 SEARCH_URL = "https://dns-shop.by/ru/category/17a89aab16404e77/videokarty/"
 DATA_FILE = 'graphic_cards.json'
 NIGHT_MODE_FILE = 'night_mode.json'
+SUBSCRIPTIONS_FILE = 'subscriptions.json'
+ETAG_CACHE_FILE = 'etag_cache.json'
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -28,32 +32,73 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Предкомпилированные шаблоны для очистки цены
+_PRICE_RE = re.compile(r'[^\d,.]')
+_DOT_RE = re.compile(r'\.(?=.*\.)')
+
+# Таблица для быстрого удаления пробелов и обозначений валюты
+# (точка сохраняется — она отделяет копейки)
+_PRICE_TRANS = str.maketrans('', '', ' \xa0 ₽BYNбруб')
+
+def _atomic_write_bytes(path, data):
+    """Атомарно записывает файл: временный файл + fsync + rename"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory)
+    try:
+        os.write(fd, data)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp, path)
+
+def _dump_json(path, obj):
+    """Сериализует объект в JSON-файл через orjson"""
+    _atomic_write_bytes(path, orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+
+def _load_json(path):
+    """Читает JSON-файл через orjson"""
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+# Файлы состояния и их содержимое по умолчанию
+_STATE_FILES = {
+    NIGHT_MODE_FILE: {"enabled": False},
+    DATA_FILE: {"graphic_cards": {}},
+    SUBSCRIPTIONS_FILE: {"users": []},
+    ETAG_CACHE_FILE: {},
+}
+
+def init_state_files():
+    """Создает отсутствующие файлы состояния одним проходом при старте"""
+    for path, default in _STATE_FILES.items():
+        if not os.path.exists(path):
+            _dump_json(path, default)
+            logger.info(f"Created state file: {path}")
+
 class NightModeManager:
     def __init__(self, filename=NIGHT_MODE_FILE):
         self.filename = filename
-        self.ensure_file_exists()
-
-    def ensure_file_exists(self):
-        """Создает файл ночного режима, если он не существует"""
-        if not os.path.exists(self.filename):
-            with open(self.filename, 'w', encoding='utf-8') as f:
-                json.dump({"enabled": False}, f, indent=2, ensure_ascii=False)
-            logger.info(f"Created night mode file: {self.filename}")
+        self._cache = None
+        self._mtime = 0
 
     def load_night_mode(self):
-        """Загружает настройки ночного режима"""
+        """Загружает настройки ночного режима (кэш с проверкой mtime файла)"""
         try:
-            with open(self.filename, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
+            stat = os.stat(self.filename)
+            if self._cache is None or stat.st_mtime != self._mtime:
+                self._cache = _load_json(self.filename)
+                self._mtime = stat.st_mtime
+            return self._cache
+        except (FileNotFoundError, orjson.JSONDecodeError, OSError) as e:
             logger.error(f"Error loading night mode: {e}")
             return {"enabled": False}
 
     def save_night_mode(self, data):
         """Сохраняет настройки ночного режима"""
         try:
-            with open(self.filename, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            _dump_json(self.filename, data)
+            self._cache = data
+            self._mtime = os.stat(self.filename).st_mtime
         except Exception as e:
             logger.error(f"Error saving night mode: {e}")
 
@@ -94,68 +139,129 @@ class NightModeManager:
 class DataManager:
     def __init__(self, filename=DATA_FILE):
         self.filename = filename
-        self.ensure_file_exists()
-
-    def ensure_file_exists(self):
-        """Создает файл данных, если он не существует"""
-        if not os.path.exists(self.filename):
-            with open(self.filename, 'w', encoding='utf-8') as f:
-                json.dump({"graphic_cards": {}}, f, indent=2, ensure_ascii=False)
-            logger.info(f"Created data file: {self.filename}")
+        self._cache = None
+        self._mtime = 0
 
     def load_data(self):
-        """Загружает данные из файла"""
+        """Загружает данные из файла (кэш с проверкой mtime файла)"""
         try:
-            with open(self.filename, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
+            stat = os.stat(self.filename)
+            if self._cache is None or stat.st_mtime != self._mtime:
+                self._cache = _load_json(self.filename)
+                self._mtime = stat.st_mtime
+            return self._cache
+        except (FileNotFoundError, orjson.JSONDecodeError, OSError) as e:
             logger.error(f"Error loading data: {e}")
             return {"graphic_cards": {}}
 
     def save_data(self, data):
         """Сохраняет данные в файл"""
         try:
-            with open(self.filename, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            _dump_json(self.filename, data)
+            self._cache = data
+            self._mtime = os.stat(self.filename).st_mtime
         except Exception as e:
             logger.error(f"Error saving data: {e}")
 
-    def get_product_key(self, title, price):
-        """Создает уникальный ключ для товара"""
-        return f"{title}_{price}"
+# Страница не изменилась с прошлого запроса (ответ 304)
+_UNCHANGED = object()
 
 class DNSParser:
     def __init__(self):
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
+        self._session = None
+        self._sem = asyncio.Semaphore(6)
+        self._inflight = {}
+        self._results = {}
+        # {url: {'etag': str, 'products': list, 'last_page': int}}
+        self._etag_cache = None
+
+    async def _get_session(self):
+        """Возвращает общую HTTP-сессию, создавая её при первом обращении"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=aiohttp.TCPConnector(
+                    limit=32,
+                    limit_per_host=8,
+                    keepalive_timeout=75,
+                    ttl_dns_cache=300
+                ),
+                timeout=aiohttp.ClientTimeout(total=30)
+            )
+        return self._session
+
+    async def aclose(self):
+        """Закрывает HTTP-сессию при остановке бота"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def _load_etag_cache(self):
+        """Загружает кэш ETag и распарсенных страниц при первом обращении"""
+        if self._etag_cache is None:
+            try:
+                self._etag_cache = _load_json(ETAG_CACHE_FILE)
+            except (FileNotFoundError, orjson.JSONDecodeError, OSError):
+                self._etag_cache = {}
+        return self._etag_cache
+
+    def _save_etag_cache(self):
+        """Сохраняет кэш ETag и распарсенных страниц"""
+        if self._etag_cache is not None:
+            try:
+                _dump_json(ETAG_CACHE_FILE, self._etag_cache)
+            except Exception as e:
+                logger.error(f"Error saving etag cache: {e}")
 
     async def fetch_page(self, session, url):
+        cache = self._load_etag_cache()
+        entry = cache.get(url)
+        headers = self.headers
+        if entry and entry.get('etag'):
+            headers = {**self.headers, 'If-None-Match': entry['etag']}
+
         try:
-            async with session.get(url, headers=self.headers) as response:
-                if response.status == 200:
-                    return await response.text()
-                else:
-                    logger.error(f"HTTP error {response.status} for {url}")
-                    return None
+            async with self._sem:
+                async with session.get(url, headers=headers) as response:
+                    if response.status == 304:
+                        logger.info(f"Page unchanged (304): {url}")
+                        return _UNCHANGED
+                    elif response.status == 200:
+                        etag = response.headers.get('ETag')
+                        if etag:
+                            cache.setdefault(url, {})['etag'] = etag
+                        else:
+                            cache.pop(url, None)
+                        # Отдаем сырые байты — selectolax принимает их напрямую,
+                        # без промежуточного декодирования в str
+                        return await response.read()
+                    else:
+                        logger.error(f"HTTP error {response.status} for {url}")
+                        return None
         except Exception as e:
             logger.error(f"Error fetching {url}: {e}")
             return None
 
     def parse_price(self, price_text):
         """Парсит цену из текста, учитывая десятичные числа"""
+        # Быстрый путь: после снятия пробелов и валюты типичная цена
+        # ("1 295.90 BYN") приводится к float напрямую, без регулярок
         try:
-            # Удаляем все нечисловые символы, кроме точки и запятой
-            cleaned_text = re.sub(r'[^\d,.]', '', price_text)
-            
-            # Заменяем запятую на точку для корректного преобразования в float
-            cleaned_text = cleaned_text.replace(',', '.')
-            
-            # Удаляем лишние точки (оставляем только первую)
-            if cleaned_text.count('.') > 1:
-                parts = cleaned_text.split('.')
-                cleaned_text = parts[0] + '.' + ''.join(parts[1:])
-            
+            return float(price_text.translate(_PRICE_TRANS))
+        except (ValueError, AttributeError):
+            pass
+
+        try:
+            # Удаляем все нечисловые символы, кроме точки и запятой,
+            # и заменяем запятую на точку для преобразования в float
+            cleaned_text = _PRICE_RE.sub('', price_text).replace(',', '.')
+
+            # Отбрасываем хвостовую точку от сокращений ("руб.", "р."),
+            # затем удаляем лишние точки (оставляем только последнюю)
+            cleaned_text = _DOT_RE.sub('', cleaned_text.rstrip('.'))
+
             return float(cleaned_text)
         except (ValueError, AttributeError) as e:
             logger.warning(f"Error parsing price '{price_text}': {e}")
@@ -165,29 +271,37 @@ class DNSParser:
         if not html:
             return []
             
-        soup = BeautifulSoup(html, 'html.parser')
-        products = soup.select(selectors['product'])
+        tree = HTMLParser(html)
+        products = tree.css(selectors['product'])
         results = []
-        
+
+        # Одна метка времени на весь проход — все товары из одного запуска
+        ts = datetime.now().isoformat()
+
+        # Выносим обращения к словарю селекторов из цикла
+        title_sel = selectors['title']
+        price_sel = selectors['price']
+        image_sel = selectors['image']
+
         for product in products:
             try:
-                title_elem = product.select_one(selectors['title'])
-                price_elem = product.select_one(selectors['price'])
-                image_elem = product.select_one(selectors['image'])
-                
+                title_elem = product.css_first(title_sel)
+                price_elem = product.css_first(price_sel)
+                image_elem = product.css_first(image_sel)
+
                 if not all([title_elem, price_elem, image_elem]):
                     continue
 
-                title = title_elem.text.strip()
-                price_text = price_elem.text.strip()
-                
+                title = title_elem.text(strip=True)
+                price_text = price_elem.text(strip=True)
+
                 # Парсим цену с учетом десятичных чисел
                 price = self.parse_price(price_text)
                 if price is None:
                     continue
-                
+
                 # Получаем URL изображения
-                image_url = image_elem.get('src', '') or image_elem.get('data-src', '')
+                image_url = image_elem.attributes.get('src') or image_elem.attributes.get('data-src') or ''
                 if image_url and not image_url.startswith('http'):
                     image_url = BASE_URL + image_url
 
@@ -197,7 +311,7 @@ class DNSParser:
                         'price': price,
                         'price_text': price_text.strip(),
                         'image_url': image_url,
-                        'timestamp': datetime.now().isoformat()
+                        'timestamp': ts
                     })
             except (ValueError, AttributeError, TypeError) as e:
                 logger.warning(f"Error parsing product: {e}")
@@ -205,63 +319,121 @@ class DNSParser:
         
         return results
 
+    def _discover_last_page(self, html):
+        """Определяет номер последней страницы по виджету пагинации"""
+        tree = HTMLParser(html)
+        pages = []
+        for elem in tree.css('div.pagination-widget__page'):
+            number = elem.attributes.get('data-page-number') or elem.text(strip=True)
+            try:
+                pages.append(int(number))
+            except (TypeError, ValueError):
+                continue
+        return max(pages) if pages else 1
+
     async def parse_all_pages(self, url, selectors):
-        async with aiohttp.ClientSession() as session:
-            all_products = []
-            page = 1
-            
-            while True:
-                paginated_url = f"{url}?avail=now%2Ctod%2Ctom%2Clat%2Cinw%2Cuna&sqctg=rtx+5060&page={page}"
-                logger.info(f"Parsing page {page}: {paginated_url}")
-                
-                html = await self.fetch_page(session, paginated_url)
-                if not html:
-                    break
-
-                products = self.parse_products(html, selectors)
-                if not products:
-                    logger.info(f"No more products found on page {page}")
-                    break
-
-                all_products.extend(products)
-                page += 1
-                await asyncio.sleep(1)
-            
-            logger.info(f"Found {len(all_products)} products below {TARGET_PRICE} BYN")
-            return all_products
+        session = await self._get_session()
+
+        def page_url(page):
+            return f"{url}?avail=now%2Ctod%2Ctom%2Clat%2Cinw%2Cuna&sqctg=rtx+5060&page={page}"
+
+        cache = self._load_etag_cache()
+        first_url = page_url(1)
+
+        logger.info(f"Parsing page 1: {first_url}")
+        first_html = await self.fetch_page(session, first_url)
+
+        if first_html is _UNCHANGED:
+            # Страница не менялась — берем результат прошлого разбора
+            entry = cache.get(first_url, {})
+            all_products = list(entry.get('products', []))
+            last_page = entry.get('last_page', 1)
+        elif first_html:
+            all_products = self.parse_products(first_html, selectors)
+            last_page = self._discover_last_page(first_html)
+            entry = cache.setdefault(first_url, {})
+            entry['products'] = list(all_products)
+            entry['last_page'] = last_page
+        else:
+            logger.info("First page unavailable, nothing to parse")
+            return []
+
+        if last_page > 1:
+            logger.info(f"Parsing pages 2-{last_page} concurrently")
+            urls = [page_url(page) for page in range(2, last_page + 1)]
+            htmls = await asyncio.gather(*[self.fetch_page(session, u) for u in urls])
+            for url_n, html in zip(urls, htmls):
+                if html is _UNCHANGED:
+                    all_products.extend(cache.get(url_n, {}).get('products', []))
+                elif html:
+                    products = self.parse_products(html, selectors)
+                    cache.setdefault(url_n, {})['products'] = products
+                    all_products.extend(products)
+
+        self._save_etag_cache()
+        logger.info(f"Found {len(all_products)} products below {TARGET_PRICE} BYN")
+        return all_products
+
+    async def parse_all_pages_cached(self, url, selectors, ttl=60):
+        """Парсит каталог, объединяя одновременные вызовы
+
+        Конкурентные вызовы (несколько пользователей нажали
+        \"Проверить сейчас\") ждут одну общую задачу, а готовый
+        результат переиспользуется в течение ttl секунд.
+        """
+        loop = asyncio.get_running_loop()
+
+        cached = self._results.get(url)
+        if cached is not None and loop.time() - cached[0] < ttl:
+            logger.info(f"Using cached parse result for {url}")
+            return cached[1]
+
+        task = self._inflight.get(url)
+        if task is not None:
+            logger.info(f"Awaiting in-flight parse for {url}")
+            return await task
+
+        task = asyncio.ensure_future(self.parse_all_pages(url, selectors))
+        self._inflight[url] = task
+        try:
+            products = await task
+            self._results[url] = (loop.time(), products)
+            return products
+        finally:
+            del self._inflight[url]
 
 class SubscriptionManager:
-    def __init__(self, filename='subscriptions.json'):
+    def __init__(self, filename=SUBSCRIPTIONS_FILE):
         self.filename = filename
-        self.ensure_file_exists()
-
-    def ensure_file_exists(self):
-        if not os.path.exists(self.filename):
-            with open(self.filename, 'w', encoding='utf-8') as f:
-                json.dump({"users": []}, f, indent=2, ensure_ascii=False)
+        self._users = None
+        self._mtime = 0
 
     def load_subscriptions(self):
+        """Загружает подписчиков в set (кэш с проверкой mtime файла)"""
         try:
-            with open(self.filename, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {"users": []}
-
-    def save_subscriptions(self, data):
-        with open(self.filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+            stat = os.stat(self.filename)
+            if self._users is None or stat.st_mtime != self._mtime:
+                self._users = set(_load_json(self.filename)['users'])
+                self._mtime = stat.st_mtime
+        except (FileNotFoundError, orjson.JSONDecodeError, KeyError, OSError):
+            self._users = set()
+        return self._users
+
+    def save_subscriptions(self):
+        _dump_json(self.filename, {"users": sorted(self._users)})
+        self._mtime = os.stat(self.filename).st_mtime
 
     def add_user(self, user_id):
-        data = self.load_subscriptions()
-        if user_id not in data['users']:
-            data['users'].append(user_id)
-            self.save_subscriptions(data)
-            logger.info(f"User {user_id} subscribed")
-            return True
-        return False
+        users = self.load_subscriptions()
+        if user_id in users:
+            return False
+        users.add(user_id)
+        self.save_subscriptions()
+        logger.info(f"User {user_id} subscribed")
+        return True
 
     def get_all_users(self):
-        return self.load_subscriptions()['users']
+        return self.load_subscriptions()
 
 # Глобальные объекты
 parser = DNSParser()
@@ -290,17 +462,20 @@ async def compare_products(current_products):
     """Сравнивает текущие товары с сохраненными и возвращает изменения"""
     saved_data = data_manager.load_data()
     saved_products = saved_data.get('graphic_cards', {})
-    
+
+    now = datetime.now().isoformat()
     current_keys = set()
     new_products = []
     updated_products = []
-    
+
     # Создаем ключи для текущих товаров
     for product in current_products:
-        key = data_manager.get_product_key(product['title'], product['price'])
+        key = f"{product['title']}_{product['price']}"
         current_keys.add(key)
-        
-        if key not in saved_products:
+
+        # Один поиск по словарю вместо "in" + повторного обращения
+        existing = saved_products.get(key)
+        if existing is None:
             # Новый товар
             new_products.append(product)
             # Добавляем в сохраненные
@@ -309,63 +484,103 @@ async def compare_products(current_products):
                 'price': product['price'],
                 'price_text': product['price_text'],
                 'image_url': product['image_url'],
-                'first_seen': datetime.now().isoformat(),
-                'last_updated': datetime.now().isoformat()
+                'first_seen': now,
+                'last_updated': now
             }
         else:
             # Товар уже есть, обновляем время
-            saved_products[key]['last_updated'] = datetime.now().isoformat()
+            existing['last_updated'] = now
             updated_products.append(product)
-    
+
     # Ищем удаленные товары
     removed_products = []
     saved_keys = set(saved_products.keys())
     removed_keys = saved_keys - current_keys
-    
+
     for key in removed_keys:
         removed_products.append(saved_products[key])
         # Удаляем из сохраненных
         del saved_products[key]
-    
-    # Сохраняем обновленные данные
-    saved_data['graphic_cards'] = saved_products
-    data_manager.save_data(saved_data)
-    
+
+    # Сохраняем обновленные данные только при реальных изменениях —
+    # запись на диск самая дорогая часть цикла
+    if new_products or removed_products:
+        saved_data['graphic_cards'] = saved_products
+        data_manager.save_data(saved_data)
+
     return {
         'new': new_products,
         'updated': updated_products,
         'removed': removed_products
     }
 
-async def send_product_message(bot, user_id, product, message_type="new"):
-    """Отправляет сообщение о товаре"""
-    try:
-        if message_type == "new":
-            caption = (
-                f"🆕 НОВЫЙ ТОВАР\n"
-                f"🎮 {product['title']}\n"
-                f"💰 Цена: {product['price_text']}\n"
-                f"⏰ Добавлен: {datetime.now().strftime('%H:%M %d.%m.%Y')}"
-            )
-        elif message_type == "removed":
-            caption = (
-                f"❌ ТОВАР УДАЛЕН\n"
-                f"🎮 {product['title']}\n"
-                f"💰 Цена: {product['price_text']}\n"
-                f"⏰ Удален: {datetime.now().strftime('%H:%M %d.%m.%Y')}"
-            )
-        else:
+# Шаблоны подписей к карточкам товаров
+_NEW_TPL = "🆕 НОВЫЙ ТОВАР\n🎮 {title}\n💰 Цена: {price_text}\n⏰ Добавлен: {ts}"
+_REMOVED_TPL = "❌ ТОВАР УДАЛЕН\n🎮 {title}\n💰 Цена: {price_text}\n⏰ Удален: {ts}"
+
+def format_product_caption(product, message_type, ts):
+    """Формирует подпись к карточке товара"""
+    if message_type == "new":
+        tpl = _NEW_TPL
+    elif message_type == "removed":
+        tpl = _REMOVED_TPL
+    else:
+        return None
+    return tpl.format(title=product['title'], price_text=product['price_text'], ts=ts)
+
+def _chunked(items, size):
+    """Разбивает список на части не длиннее size"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+async def _send_with_flood_control(send, description):
+    """Выполняет отправку, повторяя её после флуд-паузы Telegram (RetryAfter)"""
+    while True:
+        try:
+            await send()
             return
-        
-        await bot.send_photo(
+        except RetryAfter as e:
+            logger.warning(f"Flood limit while sending {description}: waiting {e.retry_after}s")
+            await asyncio.sleep(e.retry_after)
+        except Exception as e:
+            logger.error(f"Error sending {description}: {e}")
+            return
+
+async def send_product_message(bot, user_id, product, message_type="new", ts=None):
+    """Отправляет сообщение о товаре"""
+    if ts is None:
+        ts = datetime.now().strftime('%H:%M %d.%m.%Y')
+
+    caption = format_product_caption(product, message_type, ts)
+    if caption is None:
+        return
+
+    await _send_with_flood_control(
+        lambda: bot.send_photo(
             chat_id=user_id,
             photo=product['image_url'],
             caption=caption
-        )
-        await asyncio.sleep(0.5)
-        
-    except Exception as e:
-        logger.error(f"Error sending {message_type} product to {user_id}: {e}")
+        ),
+        f"{message_type} product to {user_id}"
+    )
+
+# Ограничитель параллельных отправок (Telegram допускает ~30 сообщений/с)
+_SEND_SEMAPHORE = asyncio.Semaphore(25)
+
+async def send_media_group_limited(bot, user_id, media):
+    """Отправляет альбом карточек одним запросом под общим ограничителем"""
+    async with _SEND_SEMAPHORE:
+        if len(media) == 1:
+            # sendMediaGroup требует минимум 2 элемента
+            send = lambda: bot.send_photo(
+                chat_id=user_id,
+                photo=media[0].media,
+                caption=media[0].caption
+            )
+        else:
+            send = lambda: bot.send_media_group(chat_id=user_id, media=media)
+
+        await _send_with_flood_control(send, f"media group to {user_id}")
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
@@ -419,19 +634,20 @@ async def check_now(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     # Запускаем проверку
-    products = await parser.parse_all_pages(SEARCH_URL, SELECTORS)
+    products = await parser.parse_all_pages_cached(SEARCH_URL, SELECTORS)
     changes = await compare_products(products)
     
     # Отправляем результаты пользователю
     sent_new = 0
     sent_removed = 0
-    
+    ts = datetime.now().strftime('%H:%M %d.%m.%Y')
+
     for product in changes['new']:
-        await send_product_message(context.bot, user_id, product, "new")
+        await send_product_message(context.bot, user_id, product, "new", ts)
         sent_new += 1
-    
+
     for product in changes['removed']:
-        await send_product_message(context.bot, user_id, product, "removed")
+        await send_product_message(context.bot, user_id, product, "removed", ts)
         sent_removed += 1
     
     summary = []
@@ -516,7 +732,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif text == "🌙 Ночной режим":
         await night_mode(update, context)
 
-async def send_notifications():
+async def send_notifications(application):
     """Функция для автоматической рассылки"""
     try:
         # Проверяем, нужно ли отправлять уведомления
@@ -530,63 +746,84 @@ async def send_notifications():
             return
 
         logger.info(f"Sending automatic notifications to {len(users)} users")
-        products = await parser.parse_all_pages(SEARCH_URL, SELECTORS)
+        products = await parser.parse_all_pages_cached(SEARCH_URL, SELECTORS)
         changes = await compare_products(products)
         
         if not changes['new'] and not changes['removed']:
             logger.info("No changes detected for automatic notification")
             return
 
-        # Создаем Application для отправки
-        application = Application.builder().token(TOKEN).build()
-        
-        for user_id in users:
-            sent_new = 0
-            sent_removed = 0
-            
-            for product in changes['new']:
-                await send_product_message(application.bot, user_id, product, "new")
-                sent_new += 1
-            
-            for product in changes['removed']:
-                await send_product_message(application.bot, user_id, product, "removed")
-                sent_removed += 1
-            
-            summary = []
-            if sent_new > 0:
-                summary.append(f"🆕 Новых: {sent_new}")
-            if sent_removed > 0:
-                summary.append(f"❌ Удаленных: {sent_removed}")
-            
-            if summary:
-                await application.bot.send_message(
-                    chat_id=user_id,
-                    text=f"📢 Автоматическое обновление:\n" + "\n".join(summary),
+        # Группируем карточки в альбомы по 10 штук: один HTTP-запрос
+        # вместо десяти send_photo
+        ts = datetime.now().strftime('%H:%M %d.%m.%Y')
+        media_groups = []
+        for message_type, products in (('new', changes['new']), ('removed', changes['removed'])):
+            for chunk in _chunked(products, 10):
+                media_groups.append([
+                    InputMediaPhoto(
+                        media=product['image_url'],
+                        caption=format_product_caption(product, message_type, ts)
+                    )
+                    for product in chunk
+                ])
+
+        # Отправляем все альбомы всем пользователям параллельно
+        tasks = [
+            send_media_group_limited(application.bot, user_id, media)
+            for user_id in users
+            for media in media_groups
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Error in broadcast send: {result}")
+
+        summary = []
+        if changes['new']:
+            summary.append(f"🆕 Новых: {len(changes['new'])}")
+        if changes['removed']:
+            summary.append(f"❌ Удаленных: {len(changes['removed'])}")
+
+        summary_text = f"📢 Автоматическое обновление:\n" + "\n".join(summary)
+        summary_tasks = [
+            _send_with_flood_control(
+                lambda uid=user_id: application.bot.send_message(
+                    chat_id=uid,
+                    text=summary_text,
                     reply_markup=get_main_keyboard()
-                )
-                    
+                ),
+                f"summary to {user_id}"
+            )
+            for user_id in users
+        ]
+        results = await asyncio.gather(*summary_tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Error sending summary: {result}")
+
+
     except Exception as e:
         logger.error(f"Error in automatic send_notifications: {e}")
 
-async def scheduled_task():
-    """Задача для периодической проверки"""
-    while True:
-        try:
-            # Всегда парсим и обновляем базу, даже в ночном режиме
-            logger.info("Starting scheduled parsing...")
-            products = await parser.parse_all_pages(SEARCH_URL, SELECTORS)
-            await compare_products(products)
-            logger.info("Scheduled parsing completed")
-            
-            # Отправляем уведомления только если разрешено
-            await send_notifications()
-            
-            logger.info(f"Next check in {CHECK_INTERVAL_HOURS} hours")
-            await asyncio.sleep(CHECK_INTERVAL_HOURS * 3600)
-            
-        except Exception as e:
-            logger.error(f"Error in scheduled task: {e}")
-            await asyncio.sleep(300)
+async def scheduled_cycle(context: ContextTypes.DEFAULT_TYPE):
+    """Периодическая проверка: парсинг, обновление базы, рассылка"""
+    try:
+        # Всегда парсим и обновляем базу, даже в ночном режиме
+        logger.info("Starting scheduled parsing...")
+        products = await parser.parse_all_pages_cached(SEARCH_URL, SELECTORS)
+        await compare_products(products)
+        logger.info("Scheduled parsing completed")
+
+        # Отправляем уведомления только если разрешено
+        await send_notifications(context.application)
+
+        logger.info(f"Next check in {CHECK_INTERVAL_HOURS} hours")
+    except Exception as e:
+        logger.error(f"Error in scheduled task: {e}")
+
+async def on_shutdown(application):
+    """Закрывает HTTP-сессию парсера при остановке бота"""
+    await parser.aclose()
 
 def main():
     # Проверка наличия токена
@@ -594,9 +831,13 @@ def main():
         logger.error("TELEGRAM_BOT_TOKEN not found in environment variables")
         logger.error("Please create .env file with TELEGRAM_BOT_TOKEN=your_token")
         return
-    
+
+    # Создаем отсутствующие файлы состояния
+    init_state_files()
+
+
     # Создаем Application
-    application = Application.builder().token(TOKEN).build()
+    application = Application.builder().token(TOKEN).post_shutdown(on_shutdown).build()
     
     # Добавляем обработчики команд
     application.add_handler(CommandHandler("start", start))
@@ -608,9 +849,13 @@ def main():
     # Добавляем обработчик кнопок
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, button_handler))
 
-    # Запускаем планировщик в отдельной задаче
-    loop = asyncio.get_event_loop()
-    loop.create_task(scheduled_task())
+    # Периодическая проверка через JobQueue — запускается вместе с ботом
+    # и корректно останавливается при завершении
+    application.job_queue.run_repeating(
+        scheduled_cycle,
+        interval=CHECK_INTERVAL_HOURS * 3600,
+        first=10
+    )
 
     # Запускаем бота
     logger.info("Bot started with night mode and 3-hour interval")